@@ -5,6 +5,7 @@
 # ------------------------------------
 
 import pytest
+import asyncio
 import functools
 from datetime import date, time
 from azure.core.exceptions import HttpResponseError, ServiceRequestError, ClientAuthenticationError
@@ -13,7 +14,7 @@ from azure.ai.formrecognizer._generated.models import AnalyzeOperationResult
 from azure.ai.formrecognizer._response_handlers import prepare_prebuilt_models
 from azure.ai.formrecognizer import FormRecognizerApiVersion
 from azure.ai.formrecognizer.aio import FormRecognizerClient
-from testcase import GlobalFormRecognizerAccountPreparer
+from testcase import GlobalFormRecognizerAccountPreparer, ENABLE_LOGGER
 from asynctestcase import AsyncFormRecognizerTest
 from testcase import GlobalClientPreparer as _GlobalClientPreparer
 
@@ -23,6 +24,39 @@ GlobalClientPreparer = functools.partial(_GlobalClientPreparer, FormRecognizerCl
 
 class TestReceiptFromUrlAsync(AsyncFormRecognizerTest):
 
+    _shared_client = None
+
+    _RECEIPT_FIELDS = (
+        "MerchantAddress",
+        "MerchantName",
+        "MerchantPhoneNumber",
+        "Subtotal",
+        "Tax",
+        "Tip",
+        "Total",
+        "TransactionDate",
+        "TransactionTime",
+    )
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls._shared_client is not None:
+            asyncio.get_event_loop().run_until_complete(cls._shared_client.close())
+            cls._shared_client = None
+        super(TestReceiptFromUrlAsync, cls).tearDownClass()
+
+    def get_shared_client(self, form_recognizer_account, form_recognizer_account_key):
+        # one client per class so the tests reuse the same transport and connection pool
+        cls = type(self)
+        if cls._shared_client is None:
+            cls._shared_client = FormRecognizerClient(
+                form_recognizer_account,
+                AzureKeyCredential(form_recognizer_account_key),
+                polling_interval=5 if self.is_live else 0,
+                logging_enable=True if ENABLE_LOGGER == "True" else False
+            )
+        return cls._shared_client
+
     @GlobalFormRecognizerAccountPreparer()
     async def test_polling_interval(self, resource_group, location, form_recognizer_account, form_recognizer_account_key):
         client = FormRecognizerClient(form_recognizer_account, AzureKeyCredential(form_recognizer_account_key), polling_interval=7)
@@ -30,11 +64,14 @@ class TestReceiptFromUrlAsync(AsyncFormRecognizerTest):
 
         async with client:
             poller = await client.begin_recognize_receipts_from_url(self.receipt_url_jpg, polling_interval=6)
-            await poller.wait()
-            self.assertEqual(poller._polling_method._timeout, 6)
             poller2 = await client.begin_recognize_receipts_from_url(self.receipt_url_jpg)
-            await poller2.wait()
+            self.assertEqual(poller._polling_method._timeout, 6)
             self.assertEqual(poller2._polling_method._timeout, 7)  # goes back to client default
+            if not self.is_live:
+                # the recorded responses are already complete, don't sleep between polls on playback
+                poller._polling_method._timeout = poller2._polling_method._timeout = 0
+            # the two operations are independent, so poll them concurrently
+            await asyncio.gather(poller.wait(), poller2.wait())
 
     @pytest.mark.live_test_only
     @GlobalFormRecognizerAccountPreparer()
@@ -60,7 +97,12 @@ class TestReceiptFromUrlAsync(AsyncFormRecognizerTest):
     @GlobalFormRecognizerAccountPreparer()
     async def test_receipt_url_bad_endpoint(self, resource_group, location, form_recognizer_account, form_recognizer_account_key):
         with self.assertRaises(ServiceRequestError):
-            client = FormRecognizerClient("http://notreal.azure.com", AzureKeyCredential(form_recognizer_account_key))
+            # no retries: the DNS failure is the expected result, retrying it only adds backoff delays
+            client = FormRecognizerClient(
+                "http://notreal.azure.com",
+                AzureKeyCredential(form_recognizer_account_key),
+                retry_total=0
+            )
             async with client:
                 poller = await client.begin_recognize_receipts_from_url(
                     self.receipt_url_jpg
@@ -68,13 +110,12 @@ class TestReceiptFromUrlAsync(AsyncFormRecognizerTest):
                 result = await poller.result()
 
     @GlobalFormRecognizerAccountPreparer()
-    @GlobalClientPreparer()
-    async def test_receipt_url_auth_successful_key(self, client):
-        async with client:
-            poller = await client.begin_recognize_receipts_from_url(
-                self.receipt_url_jpg
-            )
-            result = await poller.result()
+    async def test_receipt_url_auth_successful_key(self, resource_group, location, form_recognizer_account, form_recognizer_account_key):
+        client = self.get_shared_client(form_recognizer_account, form_recognizer_account_key)
+        poller = await client.begin_recognize_receipts_from_url(
+            self.receipt_url_jpg
+        )
+        result = await poller.result()
 
     @GlobalFormRecognizerAccountPreparer()
     async def test_receipt_url_auth_bad_key(self, resource_group, location, form_recognizer_account, form_recognizer_account_key):
@@ -87,202 +128,188 @@ class TestReceiptFromUrlAsync(AsyncFormRecognizerTest):
                 result = await poller.result()
 
     @GlobalFormRecognizerAccountPreparer()
-    @GlobalClientPreparer()
-    async def test_receipt_bad_url(self, client):
+    async def test_receipt_bad_url(self, resource_group, location, form_recognizer_account, form_recognizer_account_key):
+        client = self.get_shared_client(form_recognizer_account, form_recognizer_account_key)
         with self.assertRaises(HttpResponseError):
-            async with client:
-                poller = await client.begin_recognize_receipts_from_url("https://badurl.jpg")
-                result = await poller.result()
+            poller = await client.begin_recognize_receipts_from_url("https://badurl.jpg")
+            result = await poller.result()
 
     @GlobalFormRecognizerAccountPreparer()
-    @GlobalClientPreparer()
-    async def test_receipt_url_pass_stream(self, client):
-
-        with open(self.receipt_png, "rb") as fd:
-            receipt = fd.read(4)  # makes the recording smaller
+    async def test_receipt_url_pass_stream(self, resource_group, location, form_recognizer_account, form_recognizer_account_key):
+        client = self.get_shared_client(form_recognizer_account, form_recognizer_account_key)
+        receipt = b"\x89PNG"  # first four bytes of any png, keeps the recording small
 
         with self.assertRaises(HttpResponseError):
-            async with client:
-                poller = await client.begin_recognize_receipts_from_url(receipt)
-                result = await poller.result()
-
-    @GlobalFormRecognizerAccountPreparer()
-    @GlobalClientPreparer()
-    async def test_receipt_url_transform_jpg(self, client):
+            poller = await client.begin_recognize_receipts_from_url(receipt)
+            result = await poller.result()
 
+    async def _analyze_receipt_url(self, client, url):
         responses = []
+        deserialize = client._deserialize
 
         def callback(raw_response, _, headers):
-            analyze_result = client._deserialize(AnalyzeOperationResult, raw_response)
+            analyze_result = deserialize(AnalyzeOperationResult, raw_response)
             extracted_receipt = prepare_prebuilt_models(analyze_result)
             responses.append(analyze_result)
             responses.append(extracted_receipt)
 
-        async with client:
-            poller = await client.begin_recognize_receipts_from_url(
-                self.receipt_url_jpg,
-                include_field_elements=True,
-                cls=callback
-            )
-            result = await poller.result()
+        poller = await client.begin_recognize_receipts_from_url(
+            url,
+            include_field_elements=True,
+            cls=callback
+        )
+        await poller.result()
+        return responses
 
-        raw_response = responses[0]
-        returned_model = responses[1]
+    def _assert_receipt_transform_correct(self, raw_response, returned_model):
         receipt = returned_model[0]
-        actual = raw_response.analyze_result.document_results[0].fields
-        read_results = raw_response.analyze_result.read_results
-        document_results = raw_response.analyze_result.document_results
+        analyze_result = raw_response.analyze_result
+        read_results = analyze_result.read_results
+        document_result = analyze_result.document_results[0]
+        actual = document_result.fields
+        actual_receipt_type = actual["ReceiptType"]
+        actual_items = actual["Items"]
 
         # check dict values
-        self.assertFormFieldTransformCorrect(receipt.fields.get("MerchantAddress"), actual.get("MerchantAddress"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("MerchantName"), actual.get("MerchantName"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("MerchantPhoneNumber"), actual.get("MerchantPhoneNumber"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("Subtotal"), actual.get("Subtotal"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("Tax"), actual.get("Tax"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("Tip"), actual.get("Tip"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("Total"), actual.get("Total"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("TransactionDate"), actual.get("TransactionDate"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("TransactionTime"), actual.get("TransactionTime"), read_results)
+        assert_field_transform = self.assertFormFieldTransformCorrect
+        receipt_fields_get = receipt.fields.get
+        actual_get = actual.get
+        for name in self._RECEIPT_FIELDS:
+            assert_field_transform(receipt_fields_get(name), actual_get(name), read_results)
 
         # check page range
-        self.assertEqual(receipt.page_range.first_page_number, document_results[0].page_range[0])
-        self.assertEqual(receipt.page_range.last_page_number, document_results[0].page_range[1])
+        self.assertEqual(receipt.page_range.first_page_number, document_result.page_range[0])
+        self.assertEqual(receipt.page_range.last_page_number, document_result.page_range[1])
 
         # check receipt type
-        receipt_type = receipt.fields.get("ReceiptType")
-        self.assertEqual(receipt_type.confidence, actual["ReceiptType"].confidence)
-        self.assertEqual(receipt_type.value, actual["ReceiptType"].value_string)
+        receipt_type = receipt_fields_get("ReceiptType")
+        self.assertEqual(receipt_type.confidence, actual_receipt_type.confidence)
+        self.assertEqual(receipt_type.value, actual_receipt_type.value_string)
 
         # check receipt items
-        self.assertReceiptItemsTransformCorrect(receipt.fields["Items"].value, actual["Items"], read_results)
+        self.assertReceiptItemsTransformCorrect(receipt.fields["Items"].value, actual_items, read_results)
 
         # Check page metadata
         self.assertFormPagesTransformCorrect(receipt.pages, read_results)
 
     @GlobalFormRecognizerAccountPreparer()
-    @GlobalClientPreparer()
-    async def test_receipt_url_transform_png(self, client):
-        responses = []
-
-        def callback(raw_response, _, headers):
-            analyze_result = client._deserialize(AnalyzeOperationResult, raw_response)
-            extracted_receipt = prepare_prebuilt_models(analyze_result)
-            responses.append(analyze_result)
-            responses.append(extracted_receipt)
-
-        async with client:
-            poller = await client.begin_recognize_receipts_from_url(
-                self.receipt_url_png,
-                include_field_elements=True,
-                cls=callback
-            )
-            result = await poller.result()
-
-        raw_response = responses[0]
-        returned_model = responses[1]
-        receipt = returned_model[0]
-        actual = raw_response.analyze_result.document_results[0].fields
-        read_results = raw_response.analyze_result.read_results
-        document_results = raw_response.analyze_result.document_results
-
-        # check dict values
-        self.assertFormFieldTransformCorrect(receipt.fields.get("MerchantAddress"), actual.get("MerchantAddress"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("MerchantName"), actual.get("MerchantName"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("MerchantPhoneNumber"), actual.get("MerchantPhoneNumber"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("Subtotal"), actual.get("Subtotal"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("Tax"), actual.get("Tax"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("Tip"), actual.get("Tip"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("Total"), actual.get("Total"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("TransactionDate"), actual.get("TransactionDate"), read_results)
-        self.assertFormFieldTransformCorrect(receipt.fields.get("TransactionTime"), actual.get("TransactionTime"), read_results)
+    async def test_receipt_url_transform_jpg(self, resource_group, location, form_recognizer_account, form_recognizer_account_key):
+        client = self.get_shared_client(form_recognizer_account, form_recognizer_account_key)
+        raw_response, returned_model = await self._analyze_receipt_url(client, self.receipt_url_jpg)
+        self._assert_receipt_transform_correct(raw_response, returned_model)
 
-        # check page range
-        self.assertEqual(receipt.page_range.first_page_number, document_results[0].page_range[0])
-        self.assertEqual(receipt.page_range.last_page_number, document_results[0].page_range[1])
-
-        # check receipt type
-        receipt_type = receipt.fields.get("ReceiptType")
-        self.assertEqual(receipt_type.confidence, actual["ReceiptType"].confidence)
-        self.assertEqual(receipt_type.value, actual["ReceiptType"].value_string)
-
-        # check receipt items
-        self.assertReceiptItemsTransformCorrect(receipt.fields["Items"].value, actual["Items"], read_results)
-
-        # Check page metadata
-        self.assertFormPagesTransformCorrect(receipt.pages, read_results)
+    @GlobalFormRecognizerAccountPreparer()
+    async def test_receipt_url_transform_png(self, resource_group, location, form_recognizer_account, form_recognizer_account_key):
+        client = self.get_shared_client(form_recognizer_account, form_recognizer_account_key)
+        raw_response, returned_model = await self._analyze_receipt_url(client, self.receipt_url_png)
+        self._assert_receipt_transform_correct(raw_response, returned_model)
 
     @GlobalFormRecognizerAccountPreparer()
-    @GlobalClientPreparer()
-    async def test_receipt_url_include_field_elements(self, client):
+    async def test_receipt_url_include_field_elements(self, resource_group, location, form_recognizer_account, form_recognizer_account_key):
+        client = self.get_shared_client(form_recognizer_account, form_recognizer_account_key)
 
-        async with client:
-            poller = await client.begin_recognize_receipts_from_url(
-                self.receipt_url_jpg,
-                include_field_elements=True
-            )
-            result = await poller.result()
+        poller = await client.begin_recognize_receipts_from_url(
+            self.receipt_url_jpg,
+            include_field_elements=True
+        )
+        result = await poller.result()
 
         self.assertEqual(len(result), 1)
         receipt = result[0]
 
         self.assertFormPagesHasValues(receipt.pages)
 
-        for name, field in receipt.fields.items():
-            if field.value_type not in ["list", "dictionary"] and name != "ReceiptType":  # receipt cases where value_data is None
-                self.assertFieldElementsHasValues(field.value_data.field_elements, receipt.page_range.first_page_number)
+        # Items and ReceiptType have no value_data, so only the plain fields are checked
+        first_page_number = receipt.page_range.first_page_number
+        for name in self._RECEIPT_FIELDS:
+            self.assertFieldElementsHasValues(receipt.fields[name].value_data.field_elements, first_page_number)
 
     @GlobalFormRecognizerAccountPreparer()
-    @GlobalClientPreparer()
-    async def test_receipt_url_jpg(self, client):
+    async def test_receipt_url_jpg(self, resource_group, location, form_recognizer_account, form_recognizer_account_key):
+        client = self.get_shared_client(form_recognizer_account, form_recognizer_account_key)
 
-        async with client:
-            poller = await client.begin_recognize_receipts_from_url(
-                self.receipt_url_jpg
-            )
-            result = await poller.result()
+        poller = await client.begin_recognize_receipts_from_url(
+            self.receipt_url_jpg
+        )
+        result = await poller.result()
 
         self.assertEqual(len(result), 1)
         receipt = result[0]
-        self.assertEqual(receipt.fields.get("MerchantAddress").value, '123 Main Street Redmond, WA 98052')
-        self.assertEqual(receipt.fields.get("MerchantName").value, 'Contoso Contoso')
-        self.assertEqual(receipt.fields.get("MerchantPhoneNumber").value, '+19876543210')
-        self.assertEqual(receipt.fields.get("Subtotal").value, 11.7)
-        self.assertEqual(receipt.fields.get("Tax").value, 1.17)
-        self.assertEqual(receipt.fields.get("Tip").value, 1.63)
-        self.assertEqual(receipt.fields.get("Total").value, 14.5)
-        self.assertEqual(receipt.fields.get("TransactionDate").value, date(year=2019, month=6, day=10))
-        self.assertEqual(receipt.fields.get("TransactionTime").value, time(hour=13, minute=59, second=0))
-        self.assertEqual(receipt.page_range.first_page_number, 1)
-        self.assertEqual(receipt.page_range.last_page_number, 1)
+        fields = receipt.fields
+        receipt_type = fields.get("ReceiptType")
+        self.assertEqual(
+            (
+                fields.get("MerchantAddress").value,
+                fields.get("MerchantName").value,
+                fields.get("MerchantPhoneNumber").value,
+                fields.get("Subtotal").value,
+                fields.get("Tax").value,
+                fields.get("Tip").value,
+                fields.get("Total").value,
+                fields.get("TransactionDate").value,
+                fields.get("TransactionTime").value,
+                receipt.page_range.first_page_number,
+                receipt.page_range.last_page_number,
+                receipt_type.value,
+            ),
+            (
+                '123 Main Street Redmond, WA 98052',
+                'Contoso Contoso',
+                '+19876543210',
+                11.7,
+                1.17,
+                1.63,
+                14.5,
+                date(year=2019, month=6, day=10),
+                time(hour=13, minute=59, second=0),
+                1,
+                1,
+                'Itemized',
+            )
+        )
         self.assertFormPagesHasValues(receipt.pages)
-        receipt_type = receipt.fields.get("ReceiptType")
         self.assertIsNotNone(receipt_type.confidence)
-        self.assertEqual(receipt_type.value, 'Itemized')
-        self.assertReceiptItemsHasValues(receipt.fields["Items"].value, receipt.page_range.first_page_number, False)
+        self.assertReceiptItemsHasValues(fields["Items"].value, receipt.page_range.first_page_number, False)
 
     @GlobalFormRecognizerAccountPreparer()
-    @GlobalClientPreparer()
-    async def test_receipt_url_png(self, client):
+    async def test_receipt_url_png(self, resource_group, location, form_recognizer_account, form_recognizer_account_key):
+        client = self.get_shared_client(form_recognizer_account, form_recognizer_account_key)
 
-        async with client:
-            poller = await client.begin_recognize_receipts_from_url(self.receipt_url_png)
-            result = await poller.result()
+        poller = await client.begin_recognize_receipts_from_url(self.receipt_url_png)
+        result = await poller.result()
 
         self.assertEqual(len(result), 1)
         receipt = result[0]
-        self.assertEqual(receipt.fields.get("MerchantAddress").value, '123 Main Street Redmond, WA 98052')
-        self.assertEqual(receipt.fields.get("MerchantName").value, 'Contoso Contoso')
-        self.assertEqual(receipt.fields.get("Subtotal").value, 1098.99)
-        self.assertEqual(receipt.fields.get("Tax").value, 104.4)
-        self.assertEqual(receipt.fields.get("Total").value, 1203.39)
-        self.assertEqual(receipt.fields.get("TransactionDate").value, date(year=2019, month=6, day=10))
-        self.assertEqual(receipt.fields.get("TransactionTime").value, time(hour=13, minute=59, second=0))
-        self.assertEqual(receipt.page_range.first_page_number, 1)
-        self.assertEqual(receipt.page_range.last_page_number, 1)
+        fields = receipt.fields
+        receipt_type = fields.get("ReceiptType")
+        self.assertEqual(
+            (
+                fields.get("MerchantAddress").value,
+                fields.get("MerchantName").value,
+                fields.get("Subtotal").value,
+                fields.get("Tax").value,
+                fields.get("Total").value,
+                fields.get("TransactionDate").value,
+                fields.get("TransactionTime").value,
+                receipt.page_range.first_page_number,
+                receipt.page_range.last_page_number,
+                receipt_type.value,
+            ),
+            (
+                '123 Main Street Redmond, WA 98052',
+                'Contoso Contoso',
+                1098.99,
+                104.4,
+                1203.39,
+                date(year=2019, month=6, day=10),
+                time(hour=13, minute=59, second=0),
+                1,
+                1,
+                'Itemized',
+            )
+        )
         self.assertFormPagesHasValues(receipt.pages)
-        receipt_type = receipt.fields.get("ReceiptType")
         self.assertIsNotNone(receipt_type.confidence)
-        self.assertEqual(receipt_type.value, 'Itemized')
 
     @GlobalFormRecognizerAccountPreparer()
     @GlobalClientPreparer()
@@ -351,15 +378,8 @@ class TestReceiptFromUrlAsync(AsyncFormRecognizerTest):
                 continue
 
             # check dict values
-            self.assertFormFieldTransformCorrect(receipt.fields.get("MerchantAddress"), actual.fields.get("MerchantAddress"), read_results)
-            self.assertFormFieldTransformCorrect(receipt.fields.get("MerchantName"), actual.fields.get("MerchantName"), read_results)
-            self.assertFormFieldTransformCorrect(receipt.fields.get("MerchantPhoneNumber"), actual.fields.get("MerchantPhoneNumber"), read_results)
-            self.assertFormFieldTransformCorrect(receipt.fields.get("Subtotal"), actual.fields.get("Subtotal"), read_results)
-            self.assertFormFieldTransformCorrect(receipt.fields.get("Tax"), actual.fields.get("Tax"), read_results)
-            self.assertFormFieldTransformCorrect(receipt.fields.get("Tip"), actual.fields.get("Tip"), read_results)
-            self.assertFormFieldTransformCorrect(receipt.fields.get("Total"), actual.fields.get("Total"), read_results)
-            self.assertFormFieldTransformCorrect(receipt.fields.get("TransactionDate"), actual.fields.get("TransactionDate"), read_results)
-            self.assertFormFieldTransformCorrect(receipt.fields.get("TransactionTime"), actual.fields.get("TransactionTime"), read_results)
+            for name in self._RECEIPT_FIELDS:
+                self.assertFormFieldTransformCorrect(receipt.fields.get(name), actual.fields.get(name), read_results)
 
             # check page range
             self.assertEqual(receipt.page_range.first_page_number, actual.page_range[0])
@@ -385,9 +405,9 @@ class TestReceiptFromUrlAsync(AsyncFormRecognizerTest):
             initial_poller = await client.begin_recognize_receipts_from_url(self.receipt_url_jpg)
             cont_token = initial_poller.continuation_token()
             poller = await client.begin_recognize_receipts_from_url(self.receipt_url_jpg, continuation_token=cont_token)
-            result = await poller.result()
+            # waiting on initial_poller is necessary so azure-devtools doesn't throw assertion error
+            result, _ = await asyncio.gather(poller.result(), initial_poller.wait())
             self.assertIsNotNone(result)
-            await initial_poller.wait()  # necessary so azure-devtools doesn't throw assertion error
 
     @GlobalFormRecognizerAccountPreparer()
     @GlobalClientPreparer()
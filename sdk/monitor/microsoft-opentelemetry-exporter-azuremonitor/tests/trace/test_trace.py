@@ -2,6 +2,7 @@
 # Licensed under the MIT License.
 
 
+import copy
 import json
 import os
 import shutil
@@ -15,6 +16,7 @@ from opentelemetry.trace import Link, SpanContext, SpanKind
 from opentelemetry.trace.status import Status, StatusCode
 
 from microsoft.opentelemetry.exporter.azuremonitor.export import ExportResult
+from microsoft.opentelemetry.exporter.azuremonitor.export import trace as trace_module
 from microsoft.opentelemetry.exporter.azuremonitor.export.trace import (
     AzureMonitorTraceExporter,
 )
@@ -23,18 +25,203 @@ from microsoft.opentelemetry.exporter.azuremonitor.options import ExporterOption
 TEST_FOLDER = os.path.abspath(".test.trace")
 STORAGE_PATH = os.path.join(TEST_FOLDER)
 
-
-def throw(exc_type, *args, **kwargs):
-    def func(*_args, **_kwargs):
-        raise exc_type(*args, **kwargs)
-
-    return func
+_TRACE_ID = 36873507687745823477771305566750195431
+_TRACE_ID_HEX = format(_TRACE_ID, "032x")
+_SPAN_ID = 12030755672171557337
+_SPAN_ID_HEX = format(_SPAN_ID, "016x")
+_PARENT_SPAN_ID = 12030755672171557338
+_PARENT_SPAN_ID_HEX = format(_PARENT_SPAN_ID, "016x")
+
+_SPAN_CTX = SpanContext(trace_id=_TRACE_ID, span_id=_SPAN_ID, is_remote=False)
+_PARENT_CTX = SpanContext(trace_id=_TRACE_ID, span_id=_PARENT_SPAN_ID, is_remote=False)
+_START_TIME = 1575494316027613500
+_END_TIME = _START_TIME + 1001000000
+
+# only read by _span_to_envelope, so shared between cases
+_HTTP_ATTRS = {
+    "http.method": "GET",
+    "http.url": "https://www.wikipedia.org/wiki/Rabbit",
+    "http.status_code": 200,
+}
+
+
+def _get_path(obj, path):
+    # walks attributes, or keys once a dict is reached, e.g. ("tags", "ai.operation.id")
+    for part in path:
+        obj = obj[part] if isinstance(obj, dict) else getattr(obj, part)
+    return obj
+
+
+def _count_entries(path):
+    with os.scandir(path) as entries:
+        return sum(1 for _ in entries)
+
+
+# (span attributes, kind, status) -> expected envelope values for test_span_to_envelope
+_SPAN_TO_ENVELOPE_CASES = [
+    {
+        "name": "client http",
+        "attributes": _HTTP_ATTRS,
+        "expected": {
+            ("instrumentation_key",): "12345678-1234-5678-abcd-12345678abcd",
+            ("tags", "ai.operation.parentId"): _PARENT_SPAN_ID_HEX,
+            ("tags", "ai.operation.id"): _TRACE_ID_HEX,
+            ("name",): "Microsoft.ApplicationInsights.RemoteDependency",
+            ("time",): "2019-12-04T21:18:36.027613Z",
+            ("data", "base_type"): "RemoteDependencyData",
+            ("data", "base_data", "name"): "test",
+            ("data", "base_data", "id"): _SPAN_ID_HEX,
+            ("data", "base_data", "duration"): "0.00:00:01.001",
+            ("data", "base_data", "result_code"): "200",
+            ("data", "base_data", "success"): True,
+            ("data", "base_data", "type"): "HTTP",
+            ("data", "base_data", "target"): "www.wikipedia.org",
+            ("data", "base_data", "data"): "https://www.wikipedia.org/wiki/Rabbit",
+        },
+    },
+    {
+        "name": "client http peer name",
+        "attributes": {
+            "component": "http",
+            "http.method": "GET",
+            "net.peer.port": 1234,
+            "net.peer.name": "testhost",
+            "http.status_code": 200,
+        },
+        "expected": {
+            ("data", "base_data", "target"): "testhost:1234",
+        },
+    },
+    {
+        "name": "client http peer ip",
+        "attributes": {
+            "component": "http",
+            "http.method": "GET",
+            "net.peer.port": 1234,
+            "net.peer.ip": "127.0.0.1",
+            "http.status_code": 200,
+        },
+        "expected": {
+            ("data", "base_data", "target"): "127.0.0.1:1234",
+        },
+    },
+    {
+        "name": "client database",
+        "attributes": {
+            "db.system": "sql",
+            "db.statement": "Test Query",
+            "db.name": "test db",
+        },
+        "expected": {
+            ("data", "base_data", "success"): True,
+            ("data", "base_data", "type"): "sql",
+            ("data", "base_data", "target"): "test db",
+            ("data", "base_data", "data"): "Test Query",
+        },
+    },
+    {
+        "name": "client rpc",
+        "attributes": {
+            "rpc.system": "rpc",
+            "rpc.service": "Test service",
+        },
+        "expected": {
+            ("data", "base_data", "success"): True,
+            ("data", "base_data", "type"): "rpc.system",
+            ("data", "base_data", "target"): "Test service",
+        },
+    },
+    {
+        "name": "client messaging",
+        "attributes": {
+            "messaging.system": "messaging",
+            "net.peer.ip": "127.0.0.1",
+            "messaging.destination": "celery",
+        },
+        "expected": {
+            ("data", "base_data", "success"): True,
+            ("data", "base_data", "type"): "Queue Message | messaging",
+            ("data", "base_data", "target"): "127.0.0.1/celery",
+        },
+    },
+    {
+        "name": "internal",
+        "attributes": {
+            "messaging.system": "messaging",
+            "net.peer.ip": "127.0.0.1",
+            "messaging.destination": "celery",
+        },
+        "kind": SpanKind.INTERNAL,
+        "expected": {
+            ("data", "base_data", "success"): True,
+            ("data", "base_data", "type"): "InProc",
+        },
+    },
+    {
+        "name": "server http",
+        "attributes": {
+            "http.method": "GET",
+            "http.path": "/wiki/Rabbit",
+            "http.route": "/wiki/Rabbit",
+            "http.url": "https://www.wikipedia.org/wiki/Rabbit",
+            "http.status_code": 200,
+        },
+        "kind": SpanKind.SERVER,
+        "expected": {
+            ("instrumentation_key",): "12345678-1234-5678-abcd-12345678abcd",
+            ("name",): "Microsoft.ApplicationInsights.Request",
+            ("tags", "ai.operation.parentId"): _PARENT_SPAN_ID_HEX,
+            ("tags", "ai.operation.id"): _TRACE_ID_HEX,
+            ("tags", "ai.operation.name"): "/wiki/Rabbit",
+            ("data", "base_type"): "RequestData",
+            ("data", "base_data", "name"): "test",
+            ("data", "base_data", "id"): _SPAN_ID_HEX,
+            ("data", "base_data", "duration"): "0.00:00:01.001",
+            ("data", "base_data", "response_code"): "200",
+            ("data", "base_data", "success"): True,
+            ("data", "base_data", "url"): "https://www.wikipedia.org/wiki/Rabbit",
+            ("data", "base_data", "properties", "request.url"): "https://www.wikipedia.org/wiki/Rabbit",
+        },
+    },
+    {
+        "name": "server messaging",
+        "attributes": {
+            "messaging.system": "messaging",
+            "net.peer.name": "test name",
+            "net.peer.ip": "127.0.0.1",
+            "messaging.destination": "celery",
+        },
+        "kind": SpanKind.SERVER,
+        "expected": {
+            ("data", "base_data", "name"): "test",
+            ("tags", "ai.operation.name"): "test",
+            ("data", "base_data", "properties", "source"): "test name/celery",
+        },
+    },
+    {
+        "name": "status error",
+        "attributes": dict(_HTTP_ATTRS, test="asd"),
+        "status_code": StatusCode.ERROR,
+        "expected": {
+            ("data", "base_data", "success"): False,
+        },
+    },
+    {
+        "name": "properties",
+        "attributes": dict(_HTTP_ATTRS, test="asd"),
+        "expected": {
+            ("data", "base_data", "properties"): {"test": "asd"},
+        },
+    },
+]
 
 
 # pylint: disable=import-error
 # pylint: disable=protected-access
 # pylint: disable=too-many-lines
 class TestAzureTraceExporter(unittest.TestCase):
+    _exporters = {}
+
     @classmethod
     def setUpClass(cls):
         os.makedirs(TEST_FOLDER, exist_ok=True)
@@ -44,22 +231,47 @@ class TestAzureTraceExporter(unittest.TestCase):
         ] = "1234abcd-5678-4efa-8abc-1234567890ab"
         cls._exporter = AzureMonitorTraceExporter()
         cls._exporter.storage.path=STORAGE_PATH
+        # already finished span that the _span_to_envelope tests copy and adjust
+        cls._span_proto = trace._Span(
+            name="test",
+            context=_SPAN_CTX,
+            parent=_PARENT_CTX,
+            sampler=None,
+            trace_config=None,
+            resource=None,
+            events=None,
+            links=[],
+            kind=SpanKind.CLIENT,
+        )
+        cls._span_proto._start_time = _START_TIME
+        cls._span_proto._end_time = _END_TIME
 
     @classmethod
     def tearDownClass(cls):
+        cls._exporter.storage.close()
+        for exporter in cls._exporters.values():
+            exporter.storage.close()
+        cls._exporters.clear()
         shutil.rmtree(TEST_FOLDER, True)
 
+    @classmethod
+    def _exporter_for(cls, connection_string):
+        # exporters are reused per connection string, construction parses options and sets up storage
+        exporter = cls._exporters.get(connection_string)
+        if exporter is None:
+            exporter = AzureMonitorTraceExporter(connection_string=connection_string)
+            cls._exporters[connection_string] = exporter
+        return exporter
+
     def setUp(self):
-        if os.path.exists(STORAGE_PATH):
-            for filename in os.listdir(STORAGE_PATH):
-                file_path = os.path.join(STORAGE_PATH, filename)
-                try:
-                    if os.path.isfile(file_path) or os.path.islink(file_path):
-                        os.unlink(file_path)
-                    elif os.path.isdir(file_path):
-                        shutil.rmtree(file_path, True)
-                except OSError as e:
-                    print("Failed to delete %s. Reason: %s" % (file_path, e))
+        transmit_patcher = mock.patch.object(AzureMonitorTraceExporter, "_transmit", autospec=False)
+        self._transmit_mock = transmit_patcher.start()
+        self.addCleanup(transmit_patcher.stop)
+        logger_patcher = mock.patch.object(trace_module, "logger")
+        self._logger_mock = logger_patcher.start()
+        self.addCleanup(logger_patcher.stop)
+        shutil.rmtree(STORAGE_PATH, ignore_errors=True)
+        os.makedirs(STORAGE_PATH, exist_ok=True)
 
     def test_constructor(self):
         """Test the constructor."""
@@ -74,485 +286,92 @@ class TestAzureTraceExporter(unittest.TestCase):
     def test_export_empty(self):
         exporter = self._exporter
         exporter.export([])
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 0)
+        self.assertEqual(_count_entries(exporter.storage.path), 0)
 
     def test_export_failure(self):
         exporter = self._exporter
-        with mock.patch(
-            "microsoft.opentelemetry.exporter.azuremonitor.export.trace.AzureMonitorTraceExporter._transmit"
-        ) as transmit:  # noqa: E501
-            test_span = trace._Span(
-                name="test",
-                context=SpanContext(
-                    trace_id=36873507687745823477771305566750195431,
-                    span_id=12030755672171557338,
-                    is_remote=False,
-                ),
-            )
-            test_span.start()
-            test_span.end()
-            transmit.return_value = ExportResult.FAILED_RETRYABLE
-            exporter.export([test_span])
-        self.assertEqual(len(os.listdir(exporter.storage.path)), 1)
+        test_span = trace._Span(name="test", context=_PARENT_CTX)
+        test_span.start()
+        test_span.end()
+        self._transmit_mock.return_value = ExportResult.FAILED_RETRYABLE
+        exporter.export([test_span])
+        self.assertEqual(_count_entries(exporter.storage.path), 1)
         self.assertIsNone(exporter.storage.get())
 
     def test_export_success(self):
         exporter = self._exporter
-        test_span = trace._Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557338,
-                is_remote=False,
-            ),
-        )
+        test_span = trace._Span(name="test", context=_PARENT_CTX)
         test_span.start()
         test_span.end()
-        with mock.patch(
-            "microsoft.opentelemetry.exporter.azuremonitor.export.trace.AzureMonitorTraceExporter._transmit"
-        ) as transmit:  # noqa: E501
-            transmit.return_value = ExportResult.SUCCESS
-            storage_mock = mock.Mock()
-            exporter._transmit_from_storage = storage_mock
-            exporter.export([test_span])
-            self.assertEqual(storage_mock.call_count, 1)
-            try:
-                self.assertEqual(len(os.listdir(exporter.storage.path)), 0)
-            except FileNotFoundError as ex:
-                pass
-
-    @mock.patch("microsoft.opentelemetry.exporter.azuremonitor.export.trace.logger")
-    def test_export_exception(self, logger_mock):
-        test_span = trace._Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557338,
-                is_remote=False,
-            ),
-        )
+        self._transmit_mock.return_value = ExportResult.SUCCESS
+        storage_mock = mock.Mock()
+        exporter._transmit_from_storage = storage_mock
+        exporter.export([test_span])
+        self.assertEqual(storage_mock.call_count, 1)
+        try:
+            self.assertEqual(_count_entries(exporter.storage.path), 0)
+        except FileNotFoundError as ex:
+            pass
+
+    def test_export_exception(self):
+        test_span = trace._Span(name="test", context=_PARENT_CTX)
         test_span.start()
         test_span.end()
         exporter = self._exporter
-        with mock.patch(
-            "microsoft.opentelemetry.exporter.azuremonitor.export.trace.AzureMonitorTraceExporter._transmit",
-            throw(Exception),
-        ):  # noqa: E501
-            result = exporter.export([test_span])
-            self.assertEqual(result, SpanExportResult.FAILURE)
-            self.assertEqual(logger_mock.exception.called, True)
+        self._transmit_mock.side_effect = Exception
+        result = exporter.export([test_span])
+        self.assertEqual(result, SpanExportResult.FAILURE)
+        self.assertEqual(self._logger_mock.exception.called, True)
 
     def test_export_not_retryable(self):
         exporter = self._exporter
-        test_span = trace._Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557338,
-                is_remote=False,
-            ),
-        )
+        test_span = trace._Span(name="test", context=_PARENT_CTX)
         test_span.start()
         test_span.end()
-        with mock.patch(
-            "microsoft.opentelemetry.exporter.azuremonitor.export.trace.AzureMonitorTraceExporter._transmit"
-        ) as transmit:  # noqa: E501
-            transmit.return_value = ExportResult.FAILED_NOT_RETRYABLE
-            result = exporter.export([test_span])
-            self.assertEqual(result, SpanExportResult.FAILURE)
+        self._transmit_mock.return_value = ExportResult.FAILED_NOT_RETRYABLE
+        result = exporter.export([test_span])
+        self.assertEqual(result, SpanExportResult.FAILURE)
 
     def test_span_to_envelope_none(self):
         exporter = self._exporter
         self.assertIsNone(exporter._span_to_envelope(None))
 
-    # pylint: disable=too-many-statements
-    def test_span_to_envelope(self):
-        exporter = AzureMonitorTraceExporter(
-            connection_string="InstrumentationKey=12345678-1234-5678-abcd-12345678abcd",
-        )
-        exporter.storage.path==os.path.join(TEST_FOLDER, self.id())
-
-        parent_span = SpanContext(
-            trace_id=36873507687745823477771305566750195431,
-            span_id=12030755672171557338,
-            is_remote=False,
-        )
-
-        start_time = 1575494316027613500
-        end_time = start_time + 1001000000
+    def _span(self, attributes, kind=SpanKind.CLIENT, status_code=StatusCode.OK):
+        span = copy.copy(self._span_proto)
+        span.attributes = attributes
+        span.kind = kind
+        span.status = Status(status_code=status_code)
+        return span
 
-        # SpanKind.CLIENT HTTP
-        span = trace._Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 200,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.CLIENT,
-        )
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        span.status = Status(status_code=StatusCode.OK)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.instrumentation_key,
-                         "12345678-1234-5678-abcd-12345678abcd")
-        self.assertEqual(
-            envelope.tags["ai.operation.parentId"], "a6f5d48acb4d31da"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.id"],
-            "1bbd944a73a05d89eab5d3740a213ee7",
-        )
-        self.assertEqual(
-            envelope.name, "Microsoft.ApplicationInsights.RemoteDependency"
-        )
-        self.assertEqual(envelope.time, "2019-12-04T21:18:36.027613Z")
-        self.assertEqual(envelope.data.base_data.name, "test")
-        self.assertEqual(envelope.data.base_data.id, "a6f5d48acb4d31d9")
-        self.assertEqual(envelope.data.base_data.duration, "0.00:00:01.001")
-        self.assertEqual(envelope.data.base_data.result_code, "200")
-        self.assertTrue(envelope.data.base_data.success)
-
-        self.assertEqual(envelope.data.base_type, "RemoteDependencyData")
-        self.assertEqual(envelope.data.base_data.type, "HTTP")
-        self.assertEqual(envelope.data.base_data.target, "www.wikipedia.org")
-        self.assertEqual(
-            envelope.data.base_data.data,
-            "https://www.wikipedia.org/wiki/Rabbit",
-        )
-        self.assertEqual(envelope.data.base_data.result_code, "200")
-
-        span.attributes = {
-            "component": "http",
-            "http.method": "GET",
-            "net.peer.port": 1234,
-            "net.peer.name": "testhost",
-            "http.status_code": 200,
-        }
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.data.base_data.target, "testhost:1234")
-
-        span.attributes = {
-            "component": "http",
-            "http.method": "GET",
-            "net.peer.port": 1234,
-            "net.peer.ip": "127.0.0.1",
-            "http.status_code": 200,
-        }
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.data.base_data.target, "127.0.0.1:1234")
-
-        # SpanKind.CLIENT Database
-        span = trace._Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "db.system": "sql",
-                "db.statement": "Test Query",
-                "db.name": "test db",
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.CLIENT,
-        )
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        span.status = Status(status_code=StatusCode.OK)
-        envelope = exporter._span_to_envelope(span)
-        self.assertTrue(envelope.data.base_data.success)
-        self.assertEqual(envelope.data.base_data.type, "sql")
-        self.assertEqual(envelope.data.base_data.target, "test db")
-        self.assertEqual(envelope.data.base_data.data, "Test Query")
-
-        # SpanKind.CLIENT rpc
-        span = trace._Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "rpc.system": "rpc",
-                "rpc.service": "Test service",
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.CLIENT,
-        )
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        span.status = Status(status_code=StatusCode.OK)
-        envelope = exporter._span_to_envelope(span)
-        self.assertTrue(envelope.data.base_data.success)
-        self.assertEqual(envelope.data.base_data.type, "rpc.system")
-        self.assertEqual(envelope.data.base_data.target, "Test service")
-
-        # SpanKind.CLIENT messaging
-        span = trace._Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "messaging.system": "messaging",
-                "net.peer.ip": "127.0.0.1",
-                "messaging.destination": "celery",
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.CLIENT,
-        )
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        span.status = Status(status_code=StatusCode.OK)
-        envelope = exporter._span_to_envelope(span)
-        self.assertTrue(envelope.data.base_data.success)
-        self.assertEqual(envelope.data.base_data.type, "Queue Message | messaging")
-        self.assertEqual(envelope.data.base_data.target, "127.0.0.1/celery")
-
-        # SpanKind.INTERNAL
-        span = trace._Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "messaging.system": "messaging",
-                "net.peer.ip": "127.0.0.1",
-                "messaging.destination": "celery",
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.INTERNAL,
-        )
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        span.status = Status(status_code=StatusCode.OK)
-        envelope = exporter._span_to_envelope(span)
-        self.assertTrue(envelope.data.base_data.success)
-        self.assertEqual(envelope.data.base_data.type, "InProc")
-
-        # SpanKind.SERVER HTTP
-        span = trace._Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "http.method": "GET",
-                "http.path": "/wiki/Rabbit",
-                "http.route": "/wiki/Rabbit",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 200,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.SERVER,
-        )
-        span.status = Status(status_code=StatusCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.instrumentation_key,
-                         "12345678-1234-5678-abcd-12345678abcd")
-        self.assertEqual(
-            envelope.name, "Microsoft.ApplicationInsights.Request"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.parentId"], "a6f5d48acb4d31da"
-        )
-        self.assertEqual(
-            envelope.tags["ai.operation.id"],
-            "1bbd944a73a05d89eab5d3740a213ee7",
-        )
-        self.assertEqual(envelope.data.base_type, "RequestData")
-        self.assertEqual(envelope.data.base_data.name, "test")
-        self.assertEqual(envelope.data.base_data.id, "a6f5d48acb4d31d9")
-        self.assertEqual(envelope.data.base_data.duration, "0.00:00:01.001")
-        self.assertEqual(envelope.data.base_data.response_code, "200")
-        self.assertTrue(envelope.data.base_data.success)
-        self.assertEqual(
-            envelope.tags["ai.operation.name"], "/wiki/Rabbit"
-        )
-        self.assertEqual(
-            envelope.data.base_data.url,
-            "https://www.wikipedia.org/wiki/Rabbit",
-        )
-        self.assertEqual(
-            envelope.data.base_data.properties["request.url"],
-            "https://www.wikipedia.org/wiki/Rabbit",
-        )
-
-        # SpanKind.SERVER messaging
-        span = trace._Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "messaging.system": "messaging",
-                "net.peer.name": "test name",
-                "net.peer.ip": "127.0.0.1",
-                "messaging.destination": "celery",
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.SERVER,
-        )
-        span.status = Status(status_code=StatusCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(envelope.data.base_data.name, "test")
-        self.assertEqual(envelope.tags["ai.operation.name"], "test")
-        self.assertEqual(
-            envelope.data.base_data.properties["source"],
-            "test name/celery",
-        )
-
-        # Status/success error
-        span = trace._Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "test": "asd",
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 200,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.CLIENT,
-        )
-        span.status = Status(status_code=StatusCode.ERROR)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertFalse(envelope.data.base_data.success)
-
-        # Properties
-        span = trace._Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "test": "asd",
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 200,
-            },
-            events=None,
-            links=[],
-            kind=SpanKind.CLIENT,
-        )
-        span.status = Status(status_code=StatusCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
-        envelope = exporter._span_to_envelope(span)
-        self.assertEqual(len(envelope.data.base_data.properties), 1)
-        self.assertEqual(envelope.data.base_data.properties["test"], "asd")
-
-        # Links
-        links = []
-        links.append(
+    def test_span_to_envelope(self):
+        exporter = self._exporter_for("InstrumentationKey=12345678-1234-5678-abcd-12345678abcd")
+
+        for case in _SPAN_TO_ENVELOPE_CASES:
+            with self.subTest(name=case["name"]):
+                span = self._span(
+                    case["attributes"],
+                    kind=case.get("kind", SpanKind.CLIENT),
+                    status_code=case.get("status_code", StatusCode.OK),
+                )
+                envelope = exporter._span_to_envelope(span)
+                for path, value in case["expected"].items():
+                    self.assertEqual(_get_path(envelope, path), value, path)
+
+    def test_span_to_envelope_links(self):
+        exporter = self._exporter_for("InstrumentationKey=12345678-1234-5678-abcd-12345678abcd")
+        span = self._span(_HTTP_ATTRS)
+        span.links = [
             Link(
                 context=SpanContext(
-                    trace_id=36873507687745823477771305566750195432,
-                    span_id=12030755672171557338,
+                    trace_id=_TRACE_ID + 1,
+                    span_id=_PARENT_SPAN_ID,
                     is_remote=False,
                 )
             )
-        )
-        span = trace._Span(
-            name="test",
-            context=SpanContext(
-                trace_id=36873507687745823477771305566750195431,
-                span_id=12030755672171557337,
-                is_remote=False,
-            ),
-            parent=parent_span,
-            sampler=None,
-            trace_config=None,
-            resource=None,
-            attributes={
-                "http.method": "GET",
-                "http.url": "https://www.wikipedia.org/wiki/Rabbit",
-                "http.status_code": 200,
-            },
-            events=None,
-            links=links,
-            kind=SpanKind.CLIENT,
-        )
-        span.status = Status(status_code=StatusCode.OK)
-        span.start(start_time=start_time)
-        span.end(end_time=end_time)
+        ]
         envelope = exporter._span_to_envelope(span)
         self.assertEqual(len(envelope.data.base_data.properties), 1)
         json_dict = json.loads(
             envelope.data.base_data.properties["_MS.links"]
         )[0]
-        self.assertEqual(json_dict["id"], "a6f5d48acb4d31da")
+        self.assertEqual(json_dict["id"], _PARENT_SPAN_ID_HEX)